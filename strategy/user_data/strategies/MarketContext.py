@@ -3,20 +3,83 @@ MarketContext - External data integration for contextual trading
 Provides Fear & Greed Index and BTC Dominance signals for regime filtering and position sizing.
 
 Usage in backtest: Loads historical CSV data
-Usage in live: Fetches live data from APIs with TTLCache
+Usage in live: Fetches live data from APIs with a stale-while-revalidate cache
 """
 
 import os
+import json
+import time
 import logging
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
 from typing import Optional
-from cachetools import TTLCache
-import requests
 
 logger = logging.getLogger(__name__)
 
 
+def build_http_session():
+    """Pooled keep-alive session with retries on transient API errors."""
+    # Imported lazily: only live/download paths need HTTP (keeps backtest start-up lean)
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+    
+    # Ignore Retry-After: a rate-limited API must not stall a call for minutes,
+    # worst case stays ~timeout * (total + 1) before the caller's fallback
+    retry = Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 502, 503, 504],
+                  respect_retry_after_header=False, raise_on_status=False)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=8, max_retries=retry)
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def write_atomic(path, write, mode: str = 'w', **open_kwargs) -> None:
+    """
+    Write a file via a temp copy that is fsynced and renamed into place.
+    
+    The F&G and on-chain loaders memory-map their files, so writers must
+    fsync before readers map and readers must never see a partially written
+    file (e.g. from a broken download stream). The temp file is removed if
+    writing fails.
+    
+    Args:
+        path: Destination path (str or Path)
+        write: Callable receiving the open temp file object
+        mode: File open mode ('w' or 'wb')
+    """
+    tmp_path = os.fspath(path) + '.tmp'
+    try:
+        with open(tmp_path, mode, **open_kwargs) as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def save_parquet(df: pd.DataFrame, path) -> None:
+    """Persist a parquet copy of freshly parsed CSV data for faster reloads."""
+    try:
+        write_atomic(path, lambda f: df.to_parquet(f, compression='zstd'), 'wb')
+    except Exception as e:
+        logger.warning(f"Failed to write parquet cache {path}: {e}")
+
+
+# Offset between date.toordinal() and days since the Unix epoch
+_EPOCH_ORDINAL = datetime(1970, 1, 1).toordinal()
+
+
 class MarketContext:
     """
     Singleton class that provides market context data for regime filtering.
@@ -28,12 +91,40 @@ class MarketContext:
     
     _instance = None
     
-    # TTL Caches for live trading (to avoid hitting API rate limits)
-    _fng_cache = TTLCache(maxsize=1, ttl=3600)  # 1 hour cache
-    _btc_dom_cache = TTLCache(maxsize=1, ttl=600)  # 10 min cache
+    # Stake multiplier per F&G value (index 0-100), see get_stake_modifier
+    _STAKE_LUT = np.array(
+        [1.5] * 25 + [1.2] * 20 + [1.0] * 10 + [0.8] * 20 + [0.5] * 26,
+        dtype=np.float64
+    )
+    
+    # Shared HTTP session (connection pooling + keep-alive), created on first use
+    _http = None
+    _http_lock = threading.Lock()
+    
+    # Background workers for concurrent live fetches (see prewarm)
+    _executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='market_context')
+    
+    # Live caches (to avoid hitting API rate limits): key -> (value, fetched_at)
+    # Within soft TTL the value is served as-is; between soft and hard TTL it is
+    # served stale while a background refresh runs; past hard TTL we block.
+    _live_cache: dict = {}
+    _live_ttls = {
+        'fng': (3600, 86400),    # 1 hour / 1 day
+        'btc_dom': (600, 3600),  # 10 min / 1 hour
+    }
+    _refresh_lock = threading.Lock()
+    _refreshing: set = set()
+    _cache_file_lock = threading.Lock()
+    
+    # Altcoin veto state, recomputed once per bot loop by refresh_veto()
+    _veto_active: bool = False
+    _veto_btc_dom: float = 50.0
+    _BTC_BASES = frozenset({'BTC', 'WBTC', 'TBTC'})
     
     # Historical data storage
     _fng_history: Optional[pd.DataFrame] = None
+    _fng_dates_i8: Optional[np.ndarray] = None  # Days since epoch, sorted
+    _fng_values: Optional[np.ndarray] = None
     _data_dir: str = '/freqtrade/user_data/data'  # Docker path
     
     def __new__(cls):
@@ -41,16 +132,56 @@ class MarketContext:
             cls._instance = super().__new__(cls)
             cls._instance._ensure_data_exists()
             cls._instance._load_historical_data()
+            cls._instance._load_cache()
         return cls._instance
     
+    @classmethod
+    def _session(cls):
+        """Return the shared HTTP session, building it on first use."""
+        if cls._http is None:
+            with cls._http_lock:
+                if cls._http is None:
+                    cls._http = build_http_session()
+        return cls._http
+    
+    @property
+    def _cache_path(self) -> str:
+        return os.path.join(self._data_dir, '.mc_cache.json')
+    
+    def _load_cache(self) -> None:
+        """Seed the live caches from disk so a restart doesn't start cold."""
+        try:
+            with open(self._cache_path) as f:
+                saved = json.load(f)
+            
+            now = time.time()
+            for key, (_, hard_ttl) in self._live_ttls.items():
+                entry = saved.get(key)
+                if key in self._live_cache or not isinstance(entry, dict):
+                    continue
+                value, fetched_at = float(entry['v']), float(entry['t'])
+                if now - fetched_at < hard_ttl:
+                    self._live_cache[key] = (int(value) if key == 'fng' else value, fetched_at)
+        except FileNotFoundError:
+            return
+        except Exception as e:
+            # A malformed sidecar just means a cold cache, never a failed init
+            logger.debug(f"Could not read live cache {self._cache_path}: {e}")
+    
+    def _save_cache(self) -> None:
+        """Persist the live caches as a small JSON sidecar."""
+        with self._cache_file_lock:
+            try:
+                saved = {key: {'v': v, 't': t} for key, (v, t) in list(self._live_cache.items())}
+                write_atomic(self._cache_path, lambda f: json.dump(saved, f))
+            except Exception as e:
+                logger.debug(f"Could not write live cache {self._cache_path}: {e}")
+    
     def _ensure_data_exists(self) -> None:
         """
         Ensure F&G historical data exists and is up-to-date.
-        Auto-downloads if missing or older than 24 hours.
+        Auto-downloads if missing or not downloaded today (F&G updates daily).
         """
-        import csv
-        from datetime import timezone
-        
         fng_path = os.path.join(self._data_dir, 'fear_greed_index.csv')
         should_download = False
         
@@ -59,12 +190,10 @@ class MarketContext:
             logger.info("F&G data file not found, downloading...")
             should_download = True
         else:
-            # Check if file is older than 24 hours
+            # Check if file was last written on an earlier day
             try:
-                file_mtime = datetime.fromtimestamp(os.path.getmtime(fng_path), tz=timezone.utc)
-                age_hours = (datetime.now(timezone.utc) - file_mtime).total_seconds() / 3600
-                if age_hours > 24:
-                    logger.info(f"F&G data is {age_hours:.1f}h old, refreshing...")
+                if datetime.now().toordinal() > datetime.fromtimestamp(os.path.getmtime(fng_path)).toordinal():
+                    logger.info("F&G data is from a previous day, refreshing...")
                     should_download = True
             except Exception as e:
                 logger.warning(f"Could not check F&G file age: {e}")
@@ -76,51 +205,102 @@ class MarketContext:
         """Download Fear & Greed historical data from Alternative.me API."""
         import csv
         from datetime import timezone
+        try:
+            import ijson  # Optional: streams the full F&G history instead of loading it at once
+        except ImportError:
+            ijson = None
         
         try:
             # Ensure directory exists
             os.makedirs(os.path.dirname(fng_path), exist_ok=True)
             
             logger.info("Fetching Fear & Greed historical data from Alternative.me...")
-            resp = requests.get(
+            # Context manager returns the pooled connection even on error paths
+            with self._session().get(
                 "https://api.alternative.me/fng/?limit=0",
-                timeout=30
-            )
-            
-            if resp.status_code == 200:
-                data = resp.json()
-                entries = data.get('data', [])
-                
-                with open(fng_path, 'w', newline='') as f:
-                    writer = csv.writer(f)
-                    writer.writerow(['date', 'value', 'classification'])
-                    for entry in entries:
-                        ts = int(entry['timestamp'])
-                        date = datetime.fromtimestamp(ts, tz=timezone.utc).strftime('%Y-%m-%d')
-                        writer.writerow([date, entry['value'], entry['value_classification']])
-                
-                logger.info(f"Downloaded {len(entries)} F&G entries to {fng_path}")
-            else:
-                logger.warning(f"Failed to fetch F&G data: HTTP {resp.status_code}")
+                timeout=30,
+                stream=True
+            ) as resp:
+                if resp.status_code == 200:
+                    if ijson is not None:
+                        # Parse entries as they arrive, keeping memory flat
+                        resp.raw.decode_content = True
+                        entries = ijson.items(resp.raw, 'data.item')
+                    else:
+                        entries = resp.json().get('data', [])
+                    
+                    count = 0
+                    
+                    def write_rows(f):
+                        nonlocal count
+                        writer = csv.writer(f)
+                        writer.writerow(['date', 'value', 'classification'])
+                        for entry in entries:
+                            ts = int(entry['timestamp'])
+                            date = datetime.fromtimestamp(ts, tz=timezone.utc).strftime('%Y-%m-%d')
+                            writer.writerow([date, entry['value'], entry['value_classification']])
+                            count += 1
+                    
+                    write_atomic(fng_path, write_rows, newline='')
+                    
+                    logger.info(f"Downloaded {count} F&G entries to {fng_path}")
+                else:
+                    logger.warning(f"Failed to fetch F&G data: HTTP {resp.status_code}")
         except Exception as e:
             logger.warning(f"Failed to download F&G data: {e}")
     
     def _load_historical_data(self) -> None:
         """Load historical Fear & Greed data for backtesting."""
+        self._fng_by_ordinal.cache_clear()
+        
         fng_path = os.path.join(self._data_dir, 'fear_greed_index.csv')
+        parquet_path = fng_path.replace('.csv', '.parquet')
+        
+        # Prefer the typed parquet copy unless the CSV has been refreshed since
+        use_parquet = os.path.exists(parquet_path) and (
+            not os.path.exists(fng_path)
+            or os.path.getmtime(parquet_path) >= os.path.getmtime(fng_path)
+        )
         
-        if os.path.exists(fng_path):
+        if use_parquet or os.path.exists(fng_path):
             try:
-                self._fng_history = pd.read_csv(fng_path, parse_dates=['date'])
-                self._fng_history.set_index('date', inplace=True)
+                if use_parquet:
+                    self._fng_history = pd.read_parquet(parquet_path, engine='pyarrow', memory_map=True)
+                else:
+                    self._fng_history = pd.read_csv(fng_path, parse_dates=['date'], memory_map=True)
+                    self._fng_history.set_index('date', inplace=True)
+                    # F&G is 0-100, so int8 is enough (8x smaller than int64)
+                    self._fng_history['value'] = self._fng_history['value'].astype(np.int8)
+                    save_parquet(self._fng_history, parquet_path)
                 self._fng_history.sort_index(inplace=True)
+                self._fng_dates_i8 = self._fng_history.index.values.astype('datetime64[D]').view('i8')
+                self._fng_values = self._fng_history['value'].to_numpy(dtype=np.int8)
                 logger.info(f"Loaded {len(self._fng_history)} F&G historical entries")
             except Exception as e:
                 logger.warning(f"Failed to load F&G history: {e}")
                 self._fng_history = None
+                self._fng_dates_i8 = None
+                self._fng_values = None
         else:
             logger.warning(f"F&G history file not found: {fng_path}")
             self._fng_history = None
+            self._fng_dates_i8 = None
+            self._fng_values = None
+    
+    def prewarm(self, timeout: float = 3.0) -> None:
+        """
+        Fetch live F&G and BTC Dominance concurrently to populate the caches.
+        
+        Overlaps the two API round-trips so a decision cycle waits for the
+        slower one only; subsequent get_* calls are served from cache.
+        Waits at most `timeout` seconds so a slow API never stalls the bot
+        loop: fetches still running keep going in the background, and
+        callers meanwhile get the stale or neutral fallback value.
+        """
+        wait([
+            self._executor.submit(self._fetch_live_fng),
+            self._executor.submit(self._fetch_live_btc_dominance),
+        ], timeout=timeout)
     
     def get_fear_greed(self, date: Optional[datetime] = None, is_backtest: bool = False) -> int:
         """
@@ -143,47 +323,108 @@ class MarketContext:
     
     def _get_historical_fng(self, date: datetime) -> int:
         """Lookup historical F&G value for a specific date."""
-        if self._fng_history is None:
+        if self._fng_values is None:
             return 50  # Neutral fallback
         
         try:
-            # Normalize to date without time
-            lookup_date = pd.Timestamp(date.date())
-            
-            # Try exact match first
-            if lookup_date in self._fng_history.index:
-                return int(self._fng_history.loc[lookup_date, 'value'])
-            
-            # Find closest previous date
-            mask = self._fng_history.index <= lookup_date
-            if mask.any():
-                closest = self._fng_history.index[mask][-1]
-                return int(self._fng_history.loc[closest, 'value'])
-            
-            return 50  # Fallback if no data
+            return self._fng_by_ordinal(date.toordinal())
         except Exception as e:
             logger.debug(f"F&G lookup error for {date}: {e}")
             return 50
     
+    @functools.lru_cache(maxsize=8192)
+    def _fng_by_ordinal(self, ordinal: int) -> int:
+        """Memoized F&G lookup: closest entry on or before the given date ordinal."""
+        i = np.searchsorted(self._fng_dates_i8, ordinal - _EPOCH_ORDINAL, side='right') - 1
+        return 50 if i < 0 else int(self._fng_values[i])
+    
+    def get_fear_greed_array(self, dates) -> np.ndarray:
+        """
+        Vectorized historical F&G lookup for many dates in one searchsorted pass.
+        
+        Args:
+            dates: Sequence of datetimes (e.g. a dataframe 'date' column)
+            
+        Returns:
+            int8 array of F&G values, 50 (Neutral) where no data is available.
+        """
+        days = pd.DatetimeIndex(dates).values.astype('datetime64[D]').view('i8')
+        if self._fng_values is None or len(self._fng_values) == 0:
+            return np.full(len(days), 50, dtype=np.int8)
+        
+        pos = np.searchsorted(self._fng_dates_i8, days, side='right') - 1
+        return np.where(pos >= 0, self._fng_values[pos.clip(min=0)], 50).astype(np.int8)
+    
     def _fetch_live_fng(self) -> int:
         """Fetch live Fear & Greed from API with caching."""
-        if 'fng' in self._fng_cache:
-            return self._fng_cache['fng']
-        
+        return self._get_live('fng', self._refresh_fng, 50)  # Neutral fallback
+    
+    def _refresh_fng(self) -> Optional[int]:
+        """Fetch live Fear & Greed from API and store it in the cache."""
         try:
-            resp = requests.get(
+            resp = self._session().get(
                 'https://api.alternative.me/fng/',
                 timeout=5
             )
             if resp.status_code == 200:
                 data = resp.json()
                 value = int(data['data'][0]['value'])
-                self._fng_cache['fng'] = value
+                self._live_cache['fng'] = (value, time.time())
+                self._save_cache()
                 return value
         except Exception as e:
             logger.warning(f"Failed to fetch live F&G: {e}")
         
-        return 50  # Neutral fallback
+        return None
+    
+    def _get_live(self, key: str, refresh, fallback):
+        """
+        Serve a live value with stale-while-revalidate semantics.
+        
+        Args:
+            key: Cache key, also selects the (soft, hard) TTLs
+            refresh: Callable fetching and caching a fresh value (None on failure)
+            fallback: Value returned when nothing usable is cached or fetched
+        """
+        entry = self._live_cache.get(key)
+        if entry is not None:
+            value, fetched_at = entry
+            age = time.time() - fetched_at
+            soft_ttl, hard_ttl = self._live_ttls[key]
+            if age < soft_ttl:
+                return value
+            if age < hard_ttl:
+                self._schedule_refresh(key, refresh)
+                return value
+        
+        # Block on a fetch, unless one is already in flight (e.g. a prewarm
+        # that timed out): then don't wait for it, serve the fallback
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return fallback
+            self._refreshing.add(key)
+        try:
+            value = refresh()
+        finally:
+            with self._refresh_lock:
+                self._refreshing.discard(key)
+        return fallback if value is None else value
+    
+    def _schedule_refresh(self, key: str, refresh) -> None:
+        """Refresh a cache entry in the background, at most one request per key."""
+        with self._refresh_lock:
+            if key in self._refreshing:
+                return
+            self._refreshing.add(key)
+        
+        def run():
+            try:
+                refresh()
+            finally:
+                with self._refresh_lock:
+                    self._refreshing.discard(key)
+        
+        self._executor.submit(run)
     
     def get_btc_dominance(self, is_backtest: bool = False) -> float:
         """
@@ -203,24 +444,26 @@ class MarketContext:
         return self._fetch_live_btc_dominance()
     
     def _fetch_live_btc_dominance(self) -> float:
-        """Fetch live BTC Dominance from CoinGecko."""
-        if 'btc_dom' in self._btc_dom_cache:
-            return self._btc_dom_cache['btc_dom']
-        
+        """Fetch live BTC Dominance from CoinGecko with caching."""
+        return self._get_live('btc_dom', self._refresh_btc_dominance, 50.0)  # Neutral fallback
+    
+    def _refresh_btc_dominance(self) -> Optional[float]:
+        """Fetch live BTC Dominance from CoinGecko and store it in the cache."""
         try:
-            resp = requests.get(
+            resp = self._session().get(
                 'https://api.coingecko.com/api/v3/global',
                 timeout=5
             )
             if resp.status_code == 200:
                 data = resp.json()
                 dom = float(data['data']['market_cap_percentage']['btc'])
-                self._btc_dom_cache['btc_dom'] = dom
+                self._live_cache['btc_dom'] = (dom, time.time())
+                self._save_cache()
                 return dom
         except Exception as e:
             logger.warning(f"Failed to fetch BTC dominance: {e}")
         
-        return 50.0  # Neutral fallback
+        return None
     
     def get_stake_modifier(self, date: Optional[datetime] = None, is_backtest: bool = False) -> float:
         """
@@ -237,17 +480,30 @@ class MarketContext:
             Float multiplier (0.5 to 1.5)
         """
         fng = self.get_fear_greed(date, is_backtest)
+        return float(self._STAKE_LUT[min(max(fng, 0), 100)])
+    
+    def get_stake_modifier_array(self, fng_array) -> np.ndarray:
+        """Vectorized get_stake_modifier for an array of F&G values (single gather)."""
+        return self._STAKE_LUT[np.clip(fng_array, 0, 100)]
+    
+    def refresh_veto(self, is_backtest: bool = False) -> None:
+        """
+        Recompute the BTC Dominance altcoin veto.
         
-        if fng < 25:
-            return 1.5
-        elif fng < 45:
-            return 1.2
-        elif fng < 55:
-            return 1.0
-        elif fng < 75:
-            return 0.8
-        else:
-            return 0.5
+        Call once per bot loop (e.g. from bot_loop_start) so that
+        should_veto_altcoin is a plain attribute read for every pair.
+        
+        Args:
+            is_backtest: If True, the veto is disabled (no historical BTC.D)
+        """
+        if is_backtest:
+            self._veto_active = False
+            return
+        
+        self._veto_btc_dom = self.get_btc_dominance(is_backtest=False)
+        
+        # Veto altcoins when BTC dominance > 60%
+        self._veto_active = self._veto_btc_dom > 60.0
     
     def should_veto_altcoin(self, pair: str, is_backtest: bool = False) -> bool:
         """
@@ -257,6 +513,7 @@ class MarketContext:
         Altcoins typically bleed during these periods.
         
         Note: Only active in live trading (historical BTC.D not available).
+        Uses the state computed by the last refresh_veto() call.
         
         Args:
             pair: Trading pair (e.g., 'ETH/USDT')
@@ -265,23 +522,30 @@ class MarketContext:
         Returns:
             bool: True if trade should be vetoed
         """
-        # BTC pairs are never vetoed
-        if 'BTC' in pair.split('/')[0]:
-            return False
-        
         # In backtest mode, BTC.D filter is disabled (no free historical data)
-        if is_backtest:
+        if is_backtest or not self._veto_active:
             return False
         
-        btc_dom = self.get_btc_dominance(is_backtest=False)
-        
-        # Veto altcoins when BTC dominance > 60%
-        if btc_dom > 60.0:
-            logger.info(f"VETO {pair}: BTC Dominance at {btc_dom:.1f}% (>60%)")
-            return True
+        # BTC pairs (incl. wrapped BTC) are never vetoed
+        if pair.partition('/')[0] in self._BTC_BASES:
+            return False
         
-        return False
+        logger.info(f"VETO {pair}: BTC Dominance at {self._veto_btc_dom:.1f}% (>60%)")
+        return True
 
 
-# Singleton instance
-market_context = MarketContext()
+# Singleton instance, created on first use (see get_market_context)
+_mc: Optional[MarketContext] = None
+
+
+def get_market_context() -> MarketContext:
+    """
+    Return the MarketContext singleton, initializing it on first call.
+    
+    Initialization checks/downloads and loads the F&G history, so it is
+    deferred until a caller actually needs market context data.
+    """
+    global _mc
+    if _mc is None:
+        _mc = MarketContext()
+    return _mc
@@ -55,12 +55,12 @@ except ImportError:
 
 # Market Context Import (Fear & Greed, BTC Dominance)
 try:
-    from user_data.strategies.MarketContext import market_context
+    from user_data.strategies.MarketContext import get_market_context
 except ImportError:
     try:
-        from strategies.MarketContext import market_context
+        from strategies.MarketContext import get_market_context
     except ImportError:
-        from MarketContext import market_context
+        from MarketContext import get_market_context
 
 # ---------------------------------------------------------------------------------------------------------
     # Helper Functions for Dynamic ROI
@@ -1499,6 +1499,17 @@ class NFI5MOHO_WIP(IStrategy):
         dataframe['sell'] = 0
         return dataframe
 
+    # =========================================================================
+    # MARKET CONTEXT - Prefetch live F&G + BTC Dominance once per loop
+    # =========================================================================
+    def bot_loop_start(self, current_time: datetime, **kwargs) -> None:
+        if self.dp.runmode.value in ('backtest', 'hyperopt'):
+            return
+        
+        market_context = get_market_context()
+        market_context.prewarm()
+        market_context.refresh_veto()
+
     # =========================================================================
     # CONTEXTUAL TRADING - Volatility-Targeted Position Sizing
     # =========================================================================
@@ -1536,7 +1547,7 @@ class NFI5MOHO_WIP(IStrategy):
                             adjusted_stake = adjusted_stake * volatility_factor
             
             # Apply F&G sentiment modifier
-            fng_modifier = market_context.get_stake_modifier(current_time, is_backtest)
+            fng_modifier = get_market_context().get_stake_modifier(current_time, is_backtest)
             adjusted_stake = adjusted_stake * fng_modifier
             
             # Ensure within bounds
@@ -1576,7 +1587,7 @@ class NFI5MOHO_WIP(IStrategy):
                             return False
 
             # BTC Dominance Veto
-            if market_context.should_veto_altcoin(pair, is_backtest):
+            if get_market_context().should_veto_altcoin(pair, is_backtest):
                 return False
                 
         except Exception:
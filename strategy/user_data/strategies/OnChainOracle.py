@@ -2,10 +2,24 @@ import pandas as pd
 import numpy as np
 import os
 import time
-import requests
+import logging
 from pathlib import Path
 from datetime import datetime, timedelta, timezone
 
+__all__ = ['OnChainOracle']
+
+logger = logging.getLogger(__name__)
+
+# Shared HTTP session builder and atomic/parquet writers live in MarketContext
+try:
+    from user_data.strategies.MarketContext import build_http_session, write_atomic, save_parquet
+except ImportError:
+    try:
+        from strategies.MarketContext import build_http_session, write_atomic, save_parquet
+    except ImportError:
+        from MarketContext import build_http_session, write_atomic, save_parquet
+
+
 class OnChainOracle:
     """
     Singleton helper class to load and serve on-chain data from DeFiLlama.
@@ -13,8 +27,13 @@ class OnChainOracle:
     """
     _instance = None
     _data = None
+    _idx = None   # int64 ns timestamps of _data rows (sorted)
+    _cols = None  # column name -> ndarray of values, aligned with _idx
+    _data_version = 0  # bumped on every (re)load of _data
+    _merge_cache = None  # (data_version, candle_i8, pos, valid) of the last merge
     _last_fetched = 0
     _cache_duration = 21600  # 6 hours in seconds
+    _http = None  # requests.Session, created on first fetch
     
     def __new__(cls):
         if cls._instance is None:
@@ -27,6 +46,7 @@ class OnChainOracle:
         self.base_dir = Path(__file__).resolve().parent.parent.parent
         self.data_dir = self.base_dir / 'user_data' / 'data' / 'onchain'
         self.data_path = self.data_dir / 'defillama_data.csv'
+        self.parquet_path = self.data_path.with_suffix('.parquet')
         
         # Ensure directory exists
         self.data_dir.mkdir(parents=True, exist_ok=True)
@@ -46,30 +66,59 @@ class OnChainOracle:
 
         # Fetch new data if missing or stale
         try:
-            print("OnChainOracle: Fetching fresh data from DeFiLlama...")
+            logger.info("OnChainOracle: Fetching fresh data from DeFiLlama...")
             self._fetch_and_save_data()
             self._load_from_csv()
-        except Exception as e:
-            print(f"OnChainOracle Error: Failed to fetch data ({e}). Falling back to existing CSV if available.")
+        except Exception:
+            logger.exception("OnChainOracle: Failed to fetch data. Falling back to existing CSV if available.")
             if self.data_path.exists():
                 self._load_from_csv()
     
     def _load_from_csv(self):
         try:
-            if self.data_path.exists():
-                self._data = pd.read_csv(self.data_path)
+            if self.parquet_path.exists() and (
+                not self.data_path.exists()
+                or self.parquet_path.stat().st_mtime >= self.data_path.stat().st_mtime
+            ):
+                # Typed parquet copy: no CSV parsing or datetime conversion
+                self._data = pd.read_parquet(self.parquet_path, engine='pyarrow', memory_map=True)
+                self._data = self._downcast(self._data.sort_index())
+            elif self.data_path.exists():
+                self._data = pd.read_csv(self.data_path, memory_map=True)
                 self._data['date'] = pd.to_datetime(self._data['date'])
                 self._data = self._data.set_index('date').sort_index()
+                self._data = self._downcast(self._data)
+                save_parquet(self._data, self.parquet_path)
             else:
                 self._data = pd.DataFrame()
-        except Exception as e:
-            print(f"OnChainOracle Error loading CSV: {e}")
+        except Exception:
+            logger.exception("OnChainOracle: Error loading CSV")
             self._data = pd.DataFrame()
 
+        # Cache raw arrays once so merges are a searchsorted + gather
+        self._data_version += 1
+        self._merge_cache = None
+        self._idx = self._data.index.values.astype('datetime64[ns]').view('i8')
+        self._cols = {c: self._data[c].to_numpy() for c in self._data.columns}
+
+    @staticmethod
+    def _downcast(df):
+        # TVL / stablecoin mcap don't need float64 precision; float32 halves the footprint
+        for c in df.select_dtypes('float64').columns:
+            df[c] = df[c].astype(np.float32)
+        return df
+
+    @classmethod
+    def _session(cls):
+        """Return the HTTP session, building it on first use (main thread only)."""
+        if cls._http is None:
+            cls._http = build_http_session()
+        return cls._http
+
     def _fetch_and_save_data(self):
         # 1. TVL
         tvl_url = "https://api.llama.fi/v2/historicalChainTvl"
-        resp_tvl = requests.get(tvl_url, timeout=10)
+        resp_tvl = self._session().get(tvl_url, timeout=10)
         resp_tvl.raise_for_status()
         df_tvl = pd.DataFrame(resp_tvl.json())
         df_tvl['date'] = pd.to_datetime(df_tvl['date'], unit='s', utc=True)
@@ -77,7 +126,7 @@ class OnChainOracle:
 
         # 2. Stablecoins
         stable_url = "https://stablecoins.llama.fi/stablecoincharts/all"
-        resp_stable = requests.get(stable_url, timeout=10)
+        resp_stable = self._session().get(stable_url, timeout=10)
         resp_stable.raise_for_status()
         df_stable = pd.DataFrame(resp_stable.json())
         df_stable['date'] = pd.to_datetime(df_stable['date'], unit='s', utc=True)
@@ -85,8 +134,10 @@ class OnChainOracle:
         
         # Extract peggedUSD
         if 'totalCirculating' in df_stable.columns:
-            df_stable['stable_mcap'] = df_stable['totalCirculating'].apply(
-                lambda x: x.get('peggedUSD', 0) if isinstance(x, dict) else x
+            df_stable['stable_mcap'] = np.array(
+                [x.get('peggedUSD', 0) if isinstance(x, dict) else x
+                 for x in df_stable['totalCirculating'].values],
+                dtype=np.float64
             )
             df_stable = df_stable[['stable_mcap']]
         else:
@@ -95,15 +146,15 @@ class OnChainOracle:
         # Resample and Merge
         # Freqtrade uses 5m or 1h, but on-chain data is daily. 
         # We resample to 1h to match typical strategy timeframe logic.
-        df_tvl_1h = df_tvl.resample('1h').ffill()
-        df_stable_1h = df_stable.resample('1h').ffill()
-        
-        merged = pd.merge(df_tvl_1h, df_stable_1h, left_index=True, right_index=True, how='outer')
-        merged = merged.ffill() # Forward fill missing values
+        # Align both daily streams first, forward fill on the small daily frame
+        # (one stream may lack a row the other has), then upsample once.
+        merged = pd.concat([df_tvl, df_stable], axis=1).sort_index()
+        merged = merged.ffill().resample('1h').ffill()
         
         # Save
-        merged.to_csv(self.data_path)
-        print(f"OnChainOracle: Data saved to {self.data_path}")
+        write_atomic(self.data_path, merged.to_csv)
+        save_parquet(merged, self.parquet_path)
+        logger.info("OnChainOracle: Data saved to %s", self.data_path)
 
     def merge_with_dataframe(self, dataframe: pd.DataFrame) -> pd.DataFrame:
         """
@@ -120,14 +171,28 @@ class OnChainOracle:
         if 'date' not in dataframe.columns:
             return dataframe
             
-        dataframe['date'] = pd.to_datetime(dataframe['date'])
-        dataframe = dataframe.sort_values('date')
-        
-        merged = pd.merge_asof(
-            dataframe,
-            self._data,
-            on='date',
-            direction='backward'
-        )
-        
-        return merged
+        # Freqtrade already supplies datetime64[ns, UTC]; only convert otherwise
+        if not pd.api.types.is_datetime64_any_dtype(dataframe['date']):
+            dataframe['date'] = pd.to_datetime(dataframe['date'])
+        if not dataframe['date'].is_monotonic_increasing:
+            dataframe = dataframe.sort_values('date', ignore_index=True)
+
+        # Backward as-of lookup: last on-chain row at or before each candle
+        candle_i8 = dataframe['date'].values.astype('datetime64[ns]').view('i8')
+
+        # Pairs on the same timeframe share candle dates, so reuse the row
+        # positions of the previous merge when the dates are identical
+        cached = self._merge_cache
+        if (cached is not None and cached[0] == self._data_version
+                and np.array_equal(cached[1], candle_i8)):
+            pos, valid = cached[2], cached[3]
+        else:
+            pos = np.searchsorted(self._idx, candle_i8, side='right') - 1
+            valid = pos >= 0
+            pos = pos.clip(min=0)
+            self._merge_cache = (self._data_version, candle_i8, pos, valid)
+
+        for c, values in self._cols.items():
+            dataframe[c] = np.where(valid, values[pos], np.nan)
+
+        return dataframe